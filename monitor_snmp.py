@@ -1,142 +1,460 @@
-import pandas as pd
+import ipaddress
+import numpy as np
+import os
+# Carregado antes da thread do poller: importações concorrentes do pandas (pyarrow/plotly) falham
+import pandas  # noqa: F401
 import plotly.graph_objects as go
-import re
+import pyarrow as pa
 import streamlit as st
+import tempfile
+import threading
 import time
 from datetime import datetime
 from easysnmp import Session
+from streamlit_autorefresh import st_autorefresh
+
+POLL_INTERVAL = 1  # segundos
+# Sem rerun da sessão por esse tempo (aba fechada/recarregada) o poller se encerra.
+# Folga para abas em segundo plano, onde o navegador espaça os timers do autorefresh.
+HEARTBEAT_TIMEOUT = 120  # segundos
+MAX_POINTS = 300
+HISTORY_MAXLEN = 10_000  # linhas mantidas para o CSV
+HISTORY_BATCH = 60  # amostras acumuladas por RecordBatch gravado em disco
+IF_HC_IN_OCTETS = "1.3.6.1.2.1.31.1.1.1.6"
+IF_HC_OUT_OCTETS = "1.3.6.1.2.1.31.1.1.1.10"
+IF_OCTETS_32 = ("1.3.6.1.2.1.2.2.1.10", "1.3.6.1.2.1.2.2.1.16")  # ifInOctets, ifOutOctets
+TRAFFIC_DTYPE = np.dtype([
+    ("timestamp", "U8"),
+    ("in", "f4"),
+    ("out", "f4"),
+    ("oct_in", "u8"),
+    ("oct_out", "u8"),
+    ("delta_time", "f4"),
+])
+TRAFFIC_SCHEMA = pa.schema([
+    ("timestamp", pa.string()),
+    ("in", pa.float32()),
+    ("out", pa.float32()),
+    ("oct_in", pa.uint64()),
+    ("oct_out", pa.uint64()),
+    ("delta_time", pa.float32()),
+])
+
+# Layout fixo do gráfico; por rerun só o título do eixo Y (unidade) pode mudar
+_LAYOUT = dict(
+    title="Tráfego em tempo real",
+    xaxis_title="Horário",
+    legend_title="Direção",
+    paper_bgcolor='rgba(0,0,0,0)',
+    plot_bgcolor='rgba(0,0,0,0)',
+    font=dict(color='white'),
+    title_font=dict(color='white'),
+    legend=dict(font=dict(color='white')),
+    xaxis=dict(color='white'),
+    yaxis=dict(color='white', rangemode='tozero'),
+)
+
+# PNG gerado pelo próprio navegador (botão da modebar do Plotly), sem rasterizar no servidor
+_CHART_CONFIG = {
+    "toImageButtonOptions": {"format": "png", "filename": "trafego", "height": 600, "width": 1200, "scale": 2},
+    "displaylogo": False,
+}
 
 
 def get_snmp_session(ip, community, version):
     return Session(hostname=ip, community=community, version=version)
 
 
-def get_interfaces(session):
-    interface_names = session.walk("1.3.6.1.2.1.2.2.1.2")
-    interface_descriptions = session.walk("1.3.6.1.2.1.31.1.1.1.18")
+def walk_table(session, oid, version, max_repetitions):
+    # GETBULK só existe a partir do SNMPv2c; no v1 cai no walk (GetNext)
+    if version == 1:
+        return session.walk(oid)
+    return session.bulkwalk(oid, non_repeaters=0, max_repetitions=max_repetitions)
+
+
+def oid_index(item):
+    # Sem MIBs carregadas o easysnmp deixa oid_index vazio e a OID inteira em item.oid
+    return int(item.oid_index or item.oid.rpartition('.')[2])
+
+
+def get_interfaces(session, version, max_repetitions=50):
+    interface_names = walk_table(session, "1.3.6.1.2.1.2.2.1.2", version, max_repetitions)
+    interface_descriptions = walk_table(session, "1.3.6.1.2.1.31.1.1.1.18", version, max_repetitions)
     interfaces = {}
-    name_map = {int(item.oid.split('.')[-1]): item.value for item in interface_names}
-    desc_map = {int(item.oid.split('.')[-1]): item.value for item in interface_descriptions}
+    name_map = {oid_index(item): item.value for item in interface_names}
+    desc_map = {oid_index(item): item.value for item in interface_descriptions}
     for index, name in name_map.items():
         description = desc_map.get(index, "").strip()
         interfaces[index] = f"{name} ({description})" if description else name
     return interfaces
 
 
-def get_traffic_in_out(session, index):
-    oids = [
-        f"1.3.6.1.2.1.31.1.1.1.6.{index}",
-        f"1.3.6.1.2.1.31.1.1.1.10.{index}"
-    ]
+@st.cache_data(ttl=300, show_spinner=False)
+def get_interfaces_cached(ip, community, version, max_repetitions):
+    # Sessão própria e descartável: o Session do net-snmp não é seguro entre threads
+    session = get_snmp_session(ip, community, version)
+    return get_interfaces(session, version, max_repetitions)
+
+
+def traffic_oids(index, version):
+    # SNMPv1 não transporta Counter64: usa os contadores de 32 bits da ifTable
+    in_oid, out_oid = IF_OCTETS_32 if version == 1 else (IF_HC_IN_OCTETS, IF_HC_OUT_OCTETS)
+    return [f"{in_oid}.{index}", f"{out_oid}.{index}"]
+
+
+def counter_bits(oid):
+    return 32 if oid.rpartition('.')[0] in IF_OCTETS_32 else 64
+
+
+def counter_delta(current, previous, bits=64):
+    diff = current - previous
+    if diff >= 0:
+        return diff
+    modulus = 2 ** bits
+    # Valor anterior perto do limite: o contador deu a volta
+    if previous > modulus // 2:
+        return diff + modulus
+    # Caso contrário o agente zerou o contador (reboot/reset): não há delta válido
+    return None
+
+
+def get_traffic_in_out(session, oids):
     result = session.get(oids)
     oct_in = int(result[0].value)
     oct_out = int(result[1].value)
     return oct_in, oct_out
 
 
+class TrafficPoller(threading.Thread):
+    """Coleta os contadores em segundo plano, independente dos reruns do Streamlit."""
+
+    def __init__(self, target, oids, bits, interface_name):
+        super().__init__(daemon=True)
+        self.interface_name = interface_name
+        # Sessão própria: a sessão em cache é compartilhada entre reruns e usuários
+        self.session = get_snmp_session(*target)
+        self.oids = oids
+        self.bits_in, self.bits_out = bits
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.discard_event = threading.Event()
+        # Histórico vai para streams Arrow em disco; em memória fica só a janela do gráfico
+        self.segments = []
+        self.pending = []
+        self.open_segment()
+        self.samples = 0
+        # Anel com cada amostra gravada duas vezes (i e i + MAX_POINTS): as últimas N são sempre contíguas
+        self.ring = np.zeros(2 * MAX_POINTS, dtype=TRAFFIC_DTYPE)
+        self.warning = None
+        self.error = None
+        self.heartbeat = time.monotonic()
+        self.expired = False
+
+    def run(self):
+        try:
+            self.poll()
+        except Exception as e:
+            self.error = e
+        finally:
+            with self.lock:
+                self.flush()
+                self.close_segment()
+
+        # Parado, o histórico continua disponível para o CSV até o descarte ou até a sessão sumir
+        while not self.expired and not self.discard_event.wait(POLL_INTERVAL):
+            self.expired = self.stale()
+        with self.lock:
+            self.remove_history()
+
+    def poll(self):
+        prev = None
+        next_tick = time.monotonic()
+        while not self.stop_event.is_set():
+            if self.stale():
+                self.expired = True
+                return
+            prev = self.collect(prev)
+            next_tick += POLL_INTERVAL
+            self.stop_event.wait(max(0, next_tick - time.monotonic()))
+
+    def stale(self):
+        return time.monotonic() - self.heartbeat > HEARTBEAT_TIMEOUT
+
+    def collect(self, prev):
+        # O poller acompanha exatamente uma interface (um par entrada/saída)
+        oct_in, oct_out = get_traffic_in_out(self.session, self.oids)
+        current_time = datetime.now()
+        current_ns = time.monotonic_ns()
+
+        # Ignora a primeira coleta
+        if prev is None:
+            return oct_in, oct_out, current_ns
+
+        prev_in, prev_out, prev_mono_ns = prev
+
+        # Relógio monotônico: imune a ajustes de NTP no relógio de parede
+        time_diff = (current_ns - prev_mono_ns) / 1e9
+        diff_in = counter_delta(oct_in, prev_in, self.bits_in)
+        diff_out = counter_delta(oct_out, prev_out, self.bits_out)
+
+        if time_diff < 0.5 or time_diff > 3:
+            self.warning = f"Δtempo fora do intervalo ({time_diff:.2f}s). Ignorado."
+            return oct_in, oct_out, current_ns
+
+        # Contador reiniciado: registra NaN para o gráfico mostrar uma lacuna
+        if diff_in is None or diff_out is None:
+            self.warning = "Contador SNMP reiniciado no equipamento. Amostra registrada como lacuna."
+        else:
+            self.warning = None
+
+        mbps_in = (diff_in * 8) / (time_diff * 1_000_000) if diff_in is not None else float("nan")
+        mbps_out = (diff_out * 8) / (time_diff * 1_000_000) if diff_out is not None else float("nan")
+
+        sample = {
+            "timestamp": current_time.strftime("%H:%M:%S"),
+            "in": round(mbps_in, 2),
+            "out": round(mbps_out, 2),
+            "oct_in": oct_in,
+            "oct_out": oct_out,
+            "delta_time": round(time_diff, 3)
+        }
+        row = tuple(sample.values())
+        with self.lock:
+            self.pending.append(sample)
+            if len(self.pending) >= HISTORY_BATCH:
+                self.flush()
+            pos = self.samples % MAX_POINTS
+            self.ring[pos] = self.ring[pos + MAX_POINTS] = row
+            self.samples += 1
+        return oct_in, oct_out, current_ns
+
+    def touch(self):
+        # Chamado a cada rerun: mantém o poller vivo enquanto a sessão existir
+        self.heartbeat = time.monotonic()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def discard(self):
+        self.stop()
+        self.discard_event.set()
+        self.join()
+
+    # Os métodos abaixo que mexem nos segmentos são chamados com self.lock adquirido
+    def open_segment(self):
+        fd, path = tempfile.mkstemp(prefix="snmp_trafego_", suffix=".arrows")
+        os.close(fd)
+        self.segments.append(path)
+        self.sink = pa.OSFile(path, "wb")
+        self.writer = pa.ipc.new_stream(self.sink, TRAFFIC_SCHEMA)
+        self.segment_rows = 0
+
+    def close_segment(self):
+        self.writer.close()
+        self.sink.close()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.writer.write_batch(pa.RecordBatch.from_pylist(self.pending, schema=TRAFFIC_SCHEMA))
+        self.segment_rows += len(self.pending)
+        self.pending = []
+        # No máximo dois segmentos de HISTORY_MAXLEN linhas: ao encher um, o mais antigo é apagado
+        if self.segment_rows >= HISTORY_MAXLEN:
+            self.close_segment()
+            if len(self.segments) == 2:
+                os.remove(self.segments.pop(0))
+            self.open_segment()
+
+    def remove_history(self):
+        for path in self.segments:
+            os.remove(path)
+        self.segments = []
+        self.pending = []
+
+    def read_history(self):
+        # O stream pode ser lido enquanto ainda está aberto: o leitor para no fim do arquivo
+        tables = [pa.ipc.open_stream(path).read_all() for path in self.segments[:-1]]
+        if self.segments and self.segment_rows:
+            tables.append(pa.ipc.open_stream(self.segments[-1]).read_all())
+        if self.pending:
+            tables.append(pa.Table.from_pylist(self.pending, schema=TRAFFIC_SCHEMA))
+        if not tables:
+            return TRAFFIC_SCHEMA.empty_table()
+        history = pa.concat_tables(tables)
+        return history.slice(max(0, history.num_rows - HISTORY_MAXLEN))
+
+    def window(self, num_points):
+        # Últimas `num_points` amostras; copiadas porque o anel continua sendo escrito pela thread
+        with self.lock:
+            count = min(num_points, self.samples, MAX_POINTS)
+            end = (self.samples - 1) % MAX_POINTS + MAX_POINTS + 1 if self.samples else 0
+            return self.ring[end - count:end].copy()
+
+    def history_csv(self):
+        with self.lock:
+            history = self.read_history()
+        return history.to_pandas().to_csv(index=False).encode("utf-8")
+
+
 def is_valid_ip(ip_address):
-    pattern = r"^(?:[0-9]{1,3}\.){3}[0-9]{1,3}$"
-    if not re.match(pattern, ip_address):
+    try:
+        ipaddress.IPv4Address(ip_address)
+    except ValueError:
         return False
-    return all(0 <= int(part) <= 255 for part in ip_address.split('.'))
+    return True
 
 
-def plot_graph(df, monitor_in, monitor_out, chart_container):
-    if df.empty:
+def create_figure():
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(
+        mode="lines+markers",
+        name="Entrada",
+        line=dict(color="#47A8DE", width=2),
+        marker=dict(color="#47A8DE")
+    ))
+    fig.add_trace(go.Scattergl(
+        mode="lines+markers",
+        name="Saída",
+        line=dict(color="#D6008D", width=2),
+        marker=dict(color="#D6008D")
+    ))
+    fig.update_layout(_LAYOUT, yaxis_title="Mbps")
+    return fig
+
+
+def metric_values(values):
+    # Ignora as lacunas (NaN) de reset: "última" é a última amostra válida
+    valid = values[np.isfinite(values)]
+    if not len(valid):
+        return None, None, None
+    return round(float(valid[-1]), 2), round(float(valid.max()), 2), round(float(valid.min()), 2)
+
+
+def format_rate(value, unit):
+    return "—" if value is None else f"{value:.2f} {unit}"
+
+
+def display_unit(max_val):
+    # Determina se a unidade será Mbps ou Gbps
+    if max_val >= 1000:
+        return "Gbps", 1000
+    return "Mbps", 1
+
+
+def session_figure(unit, show_in, show_out):
+    # A figura é criada uma vez por sessão e só os dados dos traços mudam
+    if st.session_state.fig is None:
+        st.session_state.fig = create_figure()
+    fig = st.session_state.fig
+    fig.data[0].visible = show_in
+    fig.data[1].visible = show_out
+    if fig.layout.yaxis.title.text != unit:
+        fig.update_layout(yaxis_title=unit)
+    return fig
+
+
+def render_plot(fig, chart_container, unit, summary):
+    chart_container.plotly_chart(fig, use_container_width=True, key="main_chart", config=_CHART_CONFIG)
+
+    # Estatísticas: um indicador por direção (última, máx e mín)
+    # Só reformata os textos quando algum valor arredondado mudou
+    key = (unit, tuple(summary))
+    if st.session_state.prev_metrics is None or st.session_state.prev_metrics[0] != key:
+        st.session_state.prev_metrics = (key, [
+            (f"{direction} · Máx {format_rate(high, unit)} · Mín {format_rate(low, unit)}", format_rate(last, unit))
+            for direction, last, high, low in summary
+        ])
+
+    for col, (label, value) in zip(st.columns(2), st.session_state.prev_metrics[1]):
+        col.metric(label, value)
+
+
+# Uma variante de plot_graph por combinação de direções; nanmax ignora as lacunas (NaN) de reset
+def _plot_in(samples, chart_container):
+    timestamps = samples["timestamp"]
+    in_arr = samples["in"]
+    unit, factor = display_unit(np.nanmax(in_arr))
+    in_disp = in_arr * (1.0 / factor)
+
+    fig = session_figure(unit, True, False)
+    fig.data[0].update(x=timestamps, y=in_disp, name=f"Entrada ({unit})")
+    render_plot(fig, chart_container, unit, [("Entrada", *metric_values(in_disp))])
+
+
+def _plot_out(samples, chart_container):
+    timestamps = samples["timestamp"]
+    out_arr = samples["out"]
+    unit, factor = display_unit(np.nanmax(out_arr))
+    out_disp = out_arr * (1.0 / factor)
+
+    fig = session_figure(unit, False, True)
+    fig.data[1].update(x=timestamps, y=out_disp, name=f"Saída ({unit})")
+    render_plot(fig, chart_container, unit, [("Saída", *metric_values(out_disp))])
+
+
+def _plot_both(samples, chart_container):
+    timestamps = samples["timestamp"]
+    in_arr = samples["in"]
+    out_arr = samples["out"]
+    unit, factor = display_unit(max(np.nanmax(in_arr), np.nanmax(out_arr)))
+    scale = 1.0 / factor
+    in_disp = in_arr * scale
+    out_disp = out_arr * scale
+
+    fig = session_figure(unit, True, True)
+    fig.data[0].update(x=timestamps, y=in_disp, name=f"Entrada ({unit})")
+    fig.data[1].update(x=timestamps, y=out_disp, name=f"Saída ({unit})")
+    render_plot(fig, chart_container, unit, [
+        ("Entrada", *metric_values(in_disp)),
+        ("Saída", *metric_values(out_disp)),
+    ])
+
+
+_PLOT_FNS = {
+    (True, True): _plot_both,
+    (True, False): _plot_in,
+    (False, True): _plot_out,
+}
+
+
+def plot_graph(samples, monitor_in, monitor_out, chart_container):
+    if not len(samples):
         st.info("Sem dados suficientes para exibir o gráfico.")
         return
 
-    # Determina se a unidade será Mbps ou Gbps
-    max_val = max(
-        df["in"].max() if monitor_in else 0,
-        df["out"].max() if monitor_out else 0
-    )
+    plot_fn = _PLOT_FNS.get((monitor_in, monitor_out))
+    if plot_fn is None:
+        st.info("Selecione entrada e/ou saída para exibir o gráfico.")
+        return
+    plot_fn(samples, chart_container)
 
-    if max_val >= 1000:
-        unit = "Gbps"
-        factor = 1000
-    else:
-        unit = "Mbps"
-        factor = 1
-
-    if monitor_in:
-        df["in_display"] = df["in"] / factor
-    if monitor_out:
-        df["out_display"] = df["out"] / factor
-
-    # Gráfico
-    fig = go.Figure()
 
-    if monitor_in:
-        fig.add_trace(go.Scatter(
-            x=df["timestamp"],
-            y=df["in_display"],
-            mode="lines+markers",
-            name=f"Entrada ({unit})",
-            line=dict(color="#47A8DE", width=2),
-            marker=dict(color="#47A8DE")
-        ))
-
-    if monitor_out:
-        fig.add_trace(go.Scatter(
-            x=df["timestamp"],
-            y=df["out_display"],
-            mode="lines+markers",
-            name=f"Saída ({unit})",
-            line=dict(color="#D6008D", width=2),
-            marker=dict(color="#D6008D")
-        ))
-
-    fig.update_layout(
-        title="Tráfego em tempo real",
-        xaxis_title="Horário",
-        yaxis_title=unit,
-        legend_title="Direção",
-        paper_bgcolor='rgba(0,0,0,0)',
-        plot_bgcolor='rgba(0,0,0,0)',
-        font=dict(color='white'),
-        title_font=dict(color='white'),
-        legend=dict(font=dict(color='white')),
-        xaxis=dict(color='white'),
-        yaxis=dict(color='white', rangemode='tozero'),
-    )
-
-    chart_container.plotly_chart(fig, use_container_width=True)
-
-    # Estatísticas
-    col1, col2, col3 = st.columns(3)
-
-    if monitor_in:
-        col1.metric("Entrada Máx", f"{df['in_display'].max():.2f} {unit}")
-        col2.metric("Entrada Mín", f"{df['in_display'].min():.2f} {unit}")
-        col3.metric("Última Entrada", f"{df['in_display'].iloc[-1]:.2f} {unit}")
-
-    if monitor_out:
-        col1.metric("Saída Máx", f"{df['out_display'].max():.2f} {unit}")
-        col2.metric("Saída Mín", f"{df['out_display'].min():.2f} {unit}")
-        col3.metric("Última Saída", f"{df['out_display'].iloc[-1]:.2f} {unit}")
-
-    # Download do gráfico como PNG
-    img_bytes = fig.to_image(format="png")
-    st.download_button(
-        label="📷 Baixar Gráfico como PNG",
-        data=img_bytes,
-        file_name="trafego.png",
-        mime="image/png"
-    )
+def discard_download(key):
+    st.session_state[key] = None
+
+
+def stop_poller():
+    if st.session_state.poller is not None:
+        st.session_state.poller.stop()
+
+
+def discard_poller():
+    if st.session_state.poller is not None:
+        st.session_state.poller.discard()
+    st.session_state.poller = None
+    st.session_state.csv_bytes = None
 
 
 # ---------- Estado Inicial ----------
-for key in ["interfaces", "session", "monitoring", "traffic_data", "prev_in", "prev_out", "first_collection_skipped", "prev_time"]:
+for key in ["interfaces", "target", "oids", "oids_index", "counter_bits", "monitoring", "poller", "fig", "prev_metrics", "csv_bytes"]:
     if key not in st.session_state:
-        if key in ["session", "prev_time"]:
-            st.session_state[key] = None
-        elif key == "traffic_data":
-            st.session_state[key] = []
-        elif key == "monitoring":
+        if key == "monitoring":
             st.session_state[key] = False
+        elif key == "interfaces":
+            st.session_state[key] = {}
         else:
-            st.session_state[key] = 0 if "prev_" in key else {}
+            st.session_state[key] = None
 
 # ---------- Página ----------
 st.set_page_config(page_title="Monitoramento SNMP", page_icon="📡", layout="wide")
@@ -155,6 +473,11 @@ ip = st.text_input("IP do equipamento", placeholder="192.168.0.1")
 community = st.text_input("Community SNMP", placeholder="public", )
 version_str = st.selectbox("Versão SNMP", ["2c", "1"])
 version = 2 if version_str == "2c" else 1
+max_repetitions = st.slider(
+    "Max-repetitions (GETBULK)", 10, 100, 50, step=5,
+    disabled=version == 1,
+    help="Quantidade de linhas por requisição GETBULK ao listar interfaces (apenas SNMPv2c)."
+)
 
 col1, col2 = st.columns(2)
 with col1:
@@ -164,27 +487,35 @@ with col1:
         else:
             with st.spinner("Listando interfaces..."):
                 try:
-                    session = get_snmp_session(ip, community, version)
-                    interfaces = get_interfaces(session)
+                    interfaces = get_interfaces_cached(ip, community, version, max_repetitions)
                     if not interfaces:
                         st.warning("Nenhuma interface encontrada.")
                     else:
-                        st.session_state.session = session
+                        st.session_state.target = (ip, community, version)
                         st.session_state.interfaces = interfaces
                 except Exception as e:
                     st.error(f"Erro: {e}")
 with col2:
     if st.button("Limpar"):
+        discard_poller()
         st.session_state.interfaces = {}
-        st.session_state.session = None
+        st.session_state.target = None
+        st.session_state.oids = None
+        st.session_state.oids_index = None
         st.session_state.monitoring = False
-        st.session_state.traffic_data = []
         st.success("Resetado.")
 
 if st.session_state.interfaces:
     selected_name = st.selectbox("Interface", list(st.session_state.interfaces.values()))
     selected_index = next(k for k, v in st.session_state.interfaces.items() if v == selected_name)
 
+    # Monta as OIDs uma única vez por interface/versão, fora do loop de coleta
+    oids_key = (st.session_state.target[2], selected_index)
+    if st.session_state.oids_index != oids_key:
+        st.session_state.oids = traffic_oids(selected_index, st.session_state.target[2])
+        st.session_state.oids_index = oids_key
+        st.session_state.counter_bits = [counter_bits(oid) for oid in st.session_state.oids]
+
     col3, col4 = st.columns([1, 1])
     monitor_in = col3.checkbox("Monitorar entrada", value=True)
     monitor_out = col4.checkbox("Monitorar saída", value=True)
@@ -192,82 +523,65 @@ if st.session_state.interfaces:
     col5, col6 = st.columns([1, 1])
     with col5:
         if st.button("Iniciar"):
-            st.session_state.monitoring = True
-            st.session_state.traffic_data = []
-            st.session_state.first_collection_skipped = False
-            st.success("Monitoramento iniciado!")
+            discard_poller()
+            try:
+                poller = TrafficPoller(
+                    st.session_state.target, st.session_state.oids, st.session_state.counter_bits, selected_name
+                )
+                poller.start()
+                st.session_state.poller = poller
+                st.session_state.monitoring = True
+                st.success("Monitoramento iniciado!")
+            except Exception as e:
+                st.error(f"Erro ao iniciar o monitoramento: {e}")
 
     with col6:
         if st.button("Parar"):
+            stop_poller()
             st.session_state.monitoring = False
             st.success("Monitoramento parado.")
 
     chart_container = st.empty()
-    num_points = st.slider("Pontos no gráfico", 5, 300, 60, step=5)
-
-    if st.session_state.monitoring:
-        try:
-            oct_in, oct_out = get_traffic_in_out(st.session_state.session, selected_index)
-            current_time = datetime.now()
-
-            # Ignora a primeira coleta
-            if not st.session_state.first_collection_skipped:
-                st.session_state.prev_in = oct_in
-                st.session_state.prev_out = oct_out
-                st.session_state.prev_time = current_time
-                st.session_state.first_collection_skipped = True
-                time.sleep(1)
-                st.rerun()
-
-            prev_in = st.session_state.prev_in
-            prev_out = st.session_state.prev_out
-            prev_time = st.session_state.prev_time
-
-            st.session_state.prev_in = oct_in
-            st.session_state.prev_out = oct_out
-            st.session_state.prev_time = current_time
-
-            time_diff = (current_time - prev_time).total_seconds()
-            diff_in = oct_in - prev_in
-            diff_out = oct_out - prev_out
-
-            if time_diff < 0.5 or time_diff > 3:
-                st.warning(f"Δtempo fora do intervalo ({time_diff:.2f}s). Ignorado.")
-                time.sleep(1)
-                st.rerun()
-
-            if diff_in < 0 or diff_out < 0:
-                st.warning("Delta SNMP negativo. Ignorando coleta.")
-                time.sleep(1)
-                st.rerun()
-
-            mbps_in = (diff_in * 8) / (time_diff * 1_000_000)
-            mbps_out = (diff_out * 8) / (time_diff * 1_000_000)
-
-            st.session_state.traffic_data.append({
-                "timestamp": current_time.strftime("%H:%M:%S"),
-                "in": round(mbps_in, 2),
-                "out": round(mbps_out, 2),
-                "oct_in": oct_in,
-                "oct_out": oct_out,
-                "delta_time": round(time_diff, 3)
-            })
-
-            df = pd.DataFrame(st.session_state.traffic_data)[-num_points:]
-            plot_graph(df, monitor_in, monitor_out, chart_container)
-
-            time.sleep(1)
-            st.rerun()
-
-        except Exception as e:
-            st.error(f"Erro durante o monitoramento: {e}")
-            st.session_state.monitoring = False
-
-    if not st.session_state.monitoring and st.session_state.traffic_data:
-        df = pd.DataFrame(st.session_state.traffic_data)[-num_points:]
-        plot_graph(df, monitor_in, monitor_out, chart_container)
-
-    if st.session_state.traffic_data:
-        df = pd.DataFrame(st.session_state.traffic_data)
-        csv = df.to_csv(index=False).encode("utf-8")
-        st.download_button("📥 Baixar CSV", csv, file_name=f"{selected_name}_trafego.csv", mime="text/csv")
+    num_points = st.slider("Pontos no gráfico", 5, MAX_POINTS, 60, step=5)
+
+    poller = st.session_state.poller
+    if poller is not None:
+        poller.touch()
+        # Gráfico e CSV seguem a interface do poller, não a seleção atual
+        st.caption(f"Interface monitorada: {poller.interface_name}")
+        if poller.interface_name != selected_name:
+            st.info("A interface selecionada não é a monitorada. Clique em Iniciar para trocar.")
+        if st.session_state.monitoring:
+            if poller.error is not None:
+                st.error(f"Erro durante o monitoramento: {poller.error}")
+                st.session_state.monitoring = False
+            elif poller.expired:
+                st.warning("Monitoramento encerrado por inatividade da sessão.")
+                st.session_state.monitoring = False
+            elif poller.warning:
+                st.warning(poller.warning)
+
+        # A coleta roda no TrafficPoller; aqui só redesenhamos a tela periodicamente.
+        # Parado, o rerun mais espaçado só renova o heartbeat que mantém o histórico em disco.
+        if not poller.expired:
+            interval = POLL_INTERVAL if st.session_state.monitoring else HEARTBEAT_TIMEOUT // 4
+            st_autorefresh(interval=interval * 1000, key="monitor_refresh")
+
+        samples = poller.window(num_points)
+        if len(samples):
+            plot_graph(samples, monitor_in, monitor_out, chart_container)
+
+        # O CSV é gerado a partir do histórico em disco só quando solicitado
+        if poller.samples and not poller.expired:
+            if st.button("📥 Gerar CSV"):
+                st.session_state.csv_bytes = poller.history_csv()
+
+            if st.session_state.csv_bytes is not None:
+                st.download_button(
+                    "📥 Baixar CSV",
+                    st.session_state.csv_bytes,
+                    file_name=f"{poller.interface_name}_trafego.csv",
+                    mime="text/csv",
+                    on_click=discard_download,
+                    args=("csv_bytes",)
+                )